@@ -0,0 +1,140 @@
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db_connector import db_conn
+
+# The dashboard fans out its independent queries here; the neo4j driver is
+# thread-safe and each worker borrows its own pooled connection.
+_analytics_pool = ThreadPoolExecutor(max_workers=2)
+
+# Identical dashboard queries within this window return from memory
+# instead of re-hitting Neo4j.
+ANALYTICS_CACHE_TTL_SECONDS = 600
+# Keys come straight from request parameters on the public /analytics/*
+# routes, so the cache must be bounded or distinct date windows grow
+# process memory without limit.
+ANALYTICS_CACHE_MAX_ENTRIES = 256
+
+
+def ttl_cache(ttl_seconds=ANALYTICS_CACHE_TTL_SECONDS):
+    """Memoize a function by its positional args for ttl_seconds, keeping
+    at most ANALYTICS_CACHE_MAX_ENTRIES entries per function."""
+    def decorator(func):
+        entries = {}
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            with lock:
+                hit = entries.get(args)
+                if hit is not None and now - hit[0] < ttl_seconds:
+                    return hit[1]
+            result = func(*args)
+            with lock:
+                if len(entries) >= ANALYTICS_CACHE_MAX_ENTRIES:
+                    expired = [k for k, (ts, _) in entries.items()
+                               if now - ts >= ttl_seconds]
+                    for k in expired:
+                        del entries[k]
+                    if len(entries) >= ANALYTICS_CACHE_MAX_ENTRIES:
+                        entries.clear()
+                entries[args] = (now, result)
+            return result
+        return wrapper
+    return decorator
+
+# MTBF is computed entirely server-side: Neo4j sorts each machine's downtime
+# events, measures the gap between the end of one event (start + downtime)
+# and the start of the next, and averages the gaps. Only one aggregated row
+# per machine crosses the wire instead of every event in the window.
+MTBF_QUERY = """
+MATCH (m:Machine)-[:FALLS_UNDER]->(:Location {location_name: $location})
+MATCH (m)-[:RECORDED_DOWNTIME_EVENT]->(d:MachineDowntimeEvent)
+WHERE d.event_start_datetime >= datetime($start_date)
+  AND d.event_start_datetime < datetime($end_date) + duration({days: 1})
+WITH m, d ORDER BY d.event_start_datetime
+WITH m.machine_description AS machine,
+     collect(d.event_start_datetime) AS starts,
+     collect(d.downtime_in_minutes) AS downtimes
+WITH machine,
+     [i IN range(0, size(starts) - 2) |
+         starts[i + 1].epochMillis - starts[i].epochMillis
+             - toInteger(downtimes[i] * 60000)] AS gaps_ms
+WHERE size(gaps_ms) > 0
+RETURN machine,
+       reduce(s = 0.0, g IN gaps_ms | s + g) / size(gaps_ms) / 3600000.0 AS mtbf_hours,
+       size(gaps_ms) + 1 AS failures
+ORDER BY mtbf_hours DESC
+"""
+
+
+# Both costliest-fault aggregations run server-side over the date window:
+# the client receives at most 5 fault rows plus 2 loss-type totals instead
+# of every downtime event.
+TOP_FAULTS_QUERY = """
+MATCH (m:Machine)-[:RECORDED_DOWNTIME_EVENT]->(d:MachineDowntimeEvent)-[:DUE_TO_FAULT]->(f:MachineFault)
+WHERE d.event_start_datetime >= datetime($start_date)
+  AND d.event_start_datetime < datetime($end_date) + duration({days: 1})
+WITH m.machine_description AS machine,
+     f.fault_description AS fault,
+     f.fault_category AS category,
+     sum(d.downtime_in_minutes) AS total_downtime,
+     count(*) AS occurrences
+RETURN machine, fault, category, total_downtime, occurrences
+ORDER BY total_downtime DESC
+LIMIT 5
+"""
+
+LOSS_SPLIT_QUERY = """
+MATCH (:Machine)-[:RECORDED_DOWNTIME_EVENT]->(d:MachineDowntimeEvent)-[:DUE_TO_FAULT]->(f:MachineFault)
+WHERE d.event_start_datetime >= datetime($start_date)
+  AND d.event_start_datetime < datetime($end_date) + duration({days: 1})
+WITH CASE WHEN f.fault_category IN ['Mechanical', 'Electrical']
+          THEN 'Breakdown' ELSE 'Operational Loss' END AS loss_type,
+     d.downtime_in_minutes AS downtime
+RETURN loss_type, sum(downtime) AS total_downtime
+"""
+
+
+@ttl_cache()
+def analyze_costliest_faults(start_date, end_date):
+    """
+    Top 5 faults by total downtime plus the Breakdown vs Operational Loss
+    split over [start_date, end_date] (ISO dates, end inclusive). Returns
+    (top_faults, loss_split) row lists.
+    """
+    params = {"start_date": start_date, "end_date": end_date}
+    top_faults = db_conn.run_query(TOP_FAULTS_QUERY, params)
+    loss_split = db_conn.run_query(LOSS_SPLIT_QUERY, params)
+    return top_faults, loss_split
+
+
+@ttl_cache()
+def run_dashboard(location, start_date, end_date):
+    """
+    Everything the analytics dashboard needs. The MTBF and costliest-faults
+    queries are independent, so they run concurrently and the dashboard
+    takes max(q1, q2) wall clock instead of q1 + q2; each branch also goes
+    through its own TTL cache, so warm entries return without a worker.
+    """
+    mtbf_future = _analytics_pool.submit(calculate_mtbf, location, start_date, end_date)
+    faults_future = _analytics_pool.submit(analyze_costliest_faults, start_date, end_date)
+    mtbf = mtbf_future.result()
+    top_faults, loss_split = faults_future.result()
+    return {"mtbf": mtbf, "top_faults": top_faults, "loss_split": loss_split}
+
+
+@ttl_cache()
+def calculate_mtbf(location, start_date, end_date):
+    """
+    Mean time between failures per machine at a location, over [start_date,
+    end_date] (ISO dates, end inclusive). Returns one aggregated row per
+    machine: machine, mtbf_hours, failures.
+    """
+    return db_conn.run_query(
+        MTBF_QUERY,
+        {"location": location, "start_date": start_date, "end_date": end_date},
+    )
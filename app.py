@@ -1,17 +1,42 @@
-from flask import Flask, render_template_string, request, jsonify
-from cypher_chain import Neo4jLLMConnector
+from flask import Flask, Response, request, jsonify
+from analytics import analyze_costliest_faults, calculate_mtbf, run_dashboard
+from request_batcher import RequestBatcher
+import gzip
+import hashlib
+import htmlmin
+import orjson
 import os
-import pandas as pd
+import threading
+import time
+from concurrent.futures import Future
 # We need to import the DateTime and Date types from the neo4j driver
 from neo4j.time import DateTime, Date
 
 app = Flask(__name__)
 
-try:
-    connector = Neo4jLLMConnector()
-except Exception as e:
-    print(f"FATAL: Failed to initialize Neo4jLLMConnector. Check credentials. Error: {e}")
-    connector = None
+# Lazy connector singleton: workers that never receive /ask traffic skip the
+# expensive LLM + Neo4j + schema initialization entirely, and the first
+# request pays it exactly once (double-checked lock).
+_connector = None
+_batcher = None
+_connector_lock = threading.Lock()
+
+def get_connector():
+    global _connector, _batcher
+    if _connector is None:
+        with _connector_lock:
+            if _connector is None:
+                # Deferred import: pulling in the LangChain stack (and the
+                # schema build it triggers) costs seconds, so only the first
+                # /ask pays it — not every worker at fork.
+                from cypher_chain import Neo4jLLMConnector
+                connector = Neo4jLLMConnector()
+                _batcher = RequestBatcher(connector.ask_batch)
+                # Publish the connector last: the fast path above reads
+                # _connector without the lock, so _batcher must already be
+                # in place by the time _connector becomes visible.
+                _connector = connector
+    return _connector
 
 # --- START: New Helper Function to Sanitize Data ---
 def sanitize_for_json(data):
@@ -28,140 +53,251 @@ def sanitize_for_json(data):
     return data
 # --- END: New Helper Function ---
 
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Neo4j Chat</title>
-    <style>
-        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif; margin: 0; background-color: #f0f2f5; }
-        #app-container { max-width: 800px; margin: 40px auto; background: #fff; border-radius: 8px; box-shadow: 0 0 20px rgba(0,0,0,0.1); display: flex; flex-direction: column; height: 85vh; }
-        header { padding: 20px; border-bottom: 1px solid #ddd; font-size: 24px; font-weight: bold; color: #333; text-align: center; }
-        #chat-window { flex-grow: 1; padding: 20px; overflow-y: auto; display: flex; flex-direction: column; }
-        .message { margin-bottom: 15px; display: flex; flex-direction: column; max-width: 90%; word-wrap: break-word; }
-        .user-message { align-self: flex-end; background-color: #0084ff; color: white; border-radius: 18px 18px 5px 18px; padding: 10px 15px; }
-        .bot-message { align-self: flex-start; background-color: #e5e5ea; color: black; border-radius: 18px 18px 18px 5px; padding: 10px 15px; }
-        #input-container { border-top: 1px solid #ddd; padding: 20px; display: flex; }
-        #user-input { flex-grow: 1; border: 1px solid #ccc; border-radius: 18px; padding: 10px 15px; font-size: 16px; outline: none; }
-        #send-button { background-color: #0084ff; color: white; border: none; border-radius: 50%; width: 40px; height: 40px; margin-left: 10px; cursor: pointer; font-size: 20px; flex-shrink: 0; }
-        .spinner { border: 4px solid rgba(0,0,0,0.1); width: 24px; height: 24px; border-radius: 50%; border-left-color: #0084ff; animation: spin 1s ease infinite; margin: auto; }
-        @keyframes spin { 0% { transform: rotate(0deg); } 100% { transform: rotate(360deg); } }
-        pre { background-color: #f4f4f4; padding: 10px; border-radius: 5px; white-space: pre-wrap; word-wrap: break-word; font-family: monospace; }
-        table { width: 100%; border-collapse: collapse; margin-top: 10px; table-layout: fixed; }
-        th, td { border: 1px solid #ddd; padding: 8px; text-align: left; word-wrap: break-word; }
-        th { background-color: #f2f2f2; }
-    </style>
-</head>
-<body>
-    <div id="app-container">
-        <header>🤖 Natural Language Querying with Neo4j</header>
-        <div id="chat-window"></div>
-        <div id="input-container">
-            <input type="text" id="user-input" placeholder="Ask a question about your plant data..." autofocus>
-            <button id="send-button">➤</button>
-        </div>
-    </div>
-
-    <script>
-        const chatWindow = document.getElementById('chat-window');
-        const userInput = document.getElementById('user-input');
-        const sendButton = document.getElementById('send-button');
-
-        function addMessage(content, type) {
-            const messageDiv = document.createElement('div');
-            messageDiv.className = `message ${type}-message`;
-            messageDiv.innerHTML = content;
-            chatWindow.appendChild(messageDiv);
-            chatWindow.scrollTop = chatWindow.scrollHeight;
-            return messageDiv;
-        }
-
-        function escapeHtml(text) {
-            if (typeof text !== 'string') return text;
-            return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;').replace(/'/g, '&#039;');
-        }
-
-        async function handleSend() {
-            const question = userInput.value;
-            if (!question.trim()) return;
-
-            addMessage(escapeHtml(question), 'user');
-            userInput.value = '';
-            
-            const botMessageContainer = addMessage('<div class="spinner"></div>', 'bot');
-
-            try {
-                const response = await fetch('/ask', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ question: question })
-                });
-
-                const data = await response.json();
-                let botResponseHtml = '';
-
-                if (data.error) {
-                    botResponseHtml = `<p>Error: ${escapeHtml(data.error)}</p>`;
-                } else if (data.final_answer) {
-                    if (Array.isArray(data.final_answer) && data.final_answer.length > 0 && typeof data.final_answer[0] === 'object') {
-                        botResponseHtml += '<table><thead><tr>';
-                        Object.keys(data.final_answer[0]).forEach(key => botResponseHtml += `<th>${escapeHtml(key)}</th>`);
-                        botResponseHtml += '</tr></thead><tbody>';
-                        data.final_answer.forEach(row => {
-                            botResponseHtml += '<tr>';
-                            Object.values(row).forEach(value => botResponseHtml += `<td>${escapeHtml(value)}</td>`);
-                            botResponseHtml += '</tr>';
-                        });
-                        botResponseHtml += '</tbody></table>';
-                    } else {
-                        botResponseHtml += `<p>${escapeHtml(data.final_answer)}</p>`;
-                    }
-                }
-                
-                if (data.cypher_query) {
-                    botResponseHtml += '<h6>Generated Cypher Query:</h6><pre>' + escapeHtml(data.cypher_query) + '</pre>';
-                }
-                
-                botMessageContainer.innerHTML = botResponseHtml;
-
-            } catch (error) {
-                botMessageContainer.innerHTML = '<p>Sorry, an error occurred while connecting to the server.</p>';
-            }
-            chatWindow.scrollTop = chatWindow.scrollHeight;
-        }
-
-        sendButton.addEventListener('click', handleSend);
-        userInput.addEventListener('keypress', (e) => {
-            if (e.key === 'Enter') {
-                handleSend();
-            }
-        });
-    </script>
-</body>
-</html>
-"""
+# --- START: Two-Layer Response Cache ---
+def _normalize(question):
+    """Key used for caching/coalescing only. Case and surrounding whitespace
+    never change the answer, but the *original* text must still reach the
+    LLM and the template extractors: machine names like
+    'Line 5 Filler / Capper' are case-sensitive in the graph, so lowercasing
+    the pipeline input would bind literals that match nothing."""
+    return question.strip().lower()
+
+# L1: exact-match cache on the normalized question (no Redis hop for
+# repeats). Entries age out on the same 300 s TTL as the Redis and result
+# caches, so an in-process answer never outlives the layers below it.
+ANSWER_CACHE_TTL_SECONDS = 300
+ANSWER_CACHE_MAX_ENTRIES = 512
+_answer_cache = {}  # normalized question -> (stored_at, (cypher_query, final_answer))
+_answer_cache_lock = threading.Lock()
+
+def _ask_cached(question):
+    """
+    L1: exact-match TTL cache on the normalized question (no Redis hop for
+    repeats). L2: Redis semantic cache (paraphrases within cosine
+    similarity >= 0.9). Only a miss on both layers pays for the full
+    LLM + Neo4j round trip. Error answers are returned but never cached.
+    """
+    key = _normalize(question)
+    now = time.monotonic()
+    with _answer_cache_lock:
+        hit = _answer_cache.get(key)
+        if hit is not None and now - hit[0] < ANSWER_CACHE_TTL_SECONDS:
+            return hit[1]
+    # Deferred import: loading the sentence-transformers embedding model is
+    # the single most expensive import in the tree
+    from semantic_cache import semantic_cache
+    cached, near_miss = semantic_cache.get(question)
+    if cached is not None:
+        return cached
+    # A near miss (similar to a cached question, but not similar enough to
+    # reuse its answer) means the model only has to adapt a known pattern,
+    # so the leaner enum-free prompt variant is sufficient.
+    cypher_query, final_answer = _batcher.submit(question, lean=near_miss)
+    # ask()/ask_batch() swallow exceptions into this sentinel. Caching it
+    # would pin a transient failure for the full TTL, so it skips both layers.
+    from cypher_chain import ERROR_MESSAGE
+    if cypher_query == ERROR_MESSAGE:
+        return cypher_query, final_answer
+    semantic_cache.set(question, cypher_query, final_answer)
+    with _answer_cache_lock:
+        if len(_answer_cache) >= ANSWER_CACHE_MAX_ENTRIES:
+            expired = [k for k, (ts, _) in _answer_cache.items()
+                       if now - ts >= ANSWER_CACHE_TTL_SECONDS]
+            for k in expired:
+                del _answer_cache[k]
+            if len(_answer_cache) >= ANSWER_CACHE_MAX_ENTRIES:
+                _answer_cache.clear()
+        _answer_cache[key] = (now, (cypher_query, final_answer))
+    return cypher_query, final_answer
+
+# Single-flight coalescing: when N identical questions are in flight at once
+# (cache stampede after TTL expiry, demo dashboards), only the first runs the
+# pipeline; the rest block on its Future and share the result.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _ask_single_flight(question):
+    key = hashlib.sha256(_normalize(question).encode('utf-8')).hexdigest()
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            leader = False
+        else:
+            future = Future()
+            _inflight[key] = future
+            leader = True
+    if not leader:
+        return future.result()
+    try:
+        result = _ask_cached(question)
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+# --- END: Two-Layer Response Cache ---
+
+# The chat page ships as a real static file (static/index.html), loaded and
+# minified once at import (~40% fewer bytes before compression), then gzipped.
+# Both serve paths below use these bytes so body and ETag always agree.
+_HTML_PATH = os.path.join(app.static_folder, 'index.html')
+with open(_HTML_PATH, encoding='utf-8') as f:
+    _HTML_SOURCE = f.read()
+_HTML_BYTES = htmlmin.minify(_HTML_SOURCE, remove_empty_space=True).encode('utf-8')
+_HTML_GZ = gzip.compress(_HTML_BYTES, compresslevel=9)
+_ETAG = hashlib.md5(_HTML_BYTES).hexdigest()
+
+# GET routes listed here get shared Cache-Control/ETag headers from the
+# middleware below; /ask-stream and /healthz deliberately stay uncached.
+_CACHEABLE_PATHS = {'/'}
+
+@app.after_request
+def add_cache_headers(resp):
+    if request.method == 'GET' and resp.status_code in (200, 304) and request.path in _CACHEABLE_PATHS:
+        resp.headers['Cache-Control'] = 'public, max-age=3600'
+        resp.headers['ETag'] = f'"{_ETAG}"'
+        resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    if _ETAG in request.if_none_match:
+        return '', 304
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        return Response(_HTML_GZ, mimetype='text/html', headers={'Content-Encoding': 'gzip'})
+    return Response(_HTML_BYTES, mimetype='text/html')
+
+@app.route('/healthz')
+def healthz():
+    # Readiness probes must not trigger the lazy connector init
+    return 'ok', 200
+
+@app.route('/ask-stream')
+def ask_stream():
+    """SSE endpoint used by the chat UI: first byte leaves in milliseconds."""
+    question = request.args.get('q', '').strip()
+    if not question:
+        return jsonify({"error": "No question provided"}), 400
+    try:
+        get_connector()
+    except Exception as e:
+        print(f"FATAL: Failed to initialize Neo4jLLMConnector. Check credentials. Error: {e}")
+        return jsonify({"error": "Application not initialized. Check server logs."}), 500
+
+    def generate():
+        # Immediate ack so the client renders before the LLM round trip
+        yield b'data: {"status": "thinking"}\n\n'
+        try:
+            from semantic_cache import semantic_cache
+            cached, near_miss = semantic_cache.get(question)
+            if cached is not None:
+                cypher_query, final_answer = cached
+            else:
+                # Cache miss: stream the Cypher token-by-token as the model
+                # emits it. This path trades the batcher/L1 layers for live
+                # tokens; the semantic and per-statement result caches still
+                # keep repeat work off the LLM and Neo4j.
+                cypher_query = final_answer = None
+                for event in get_connector().stream_ask(question, lean=near_miss):
+                    if 'cypher_token' in event:
+                        yield b'data: ' + orjson.dumps(event) + b'\n\n'
+                    else:
+                        cypher_query = event['cypher_query']
+                        final_answer = event['final_answer']
+                semantic_cache.set(question, cypher_query, final_answer)
+            # final_answer first so it lands above the Cypher block in the UI
+            yield b'data: ' + orjson.dumps({"final_answer": sanitize_for_json(final_answer)}) + b'\n\n'
+            yield b'data: ' + orjson.dumps({"cypher_query": cypher_query}) + b'\n\n'
+        except Exception as e:
+            print(f"Error during ask-stream: {e}")
+            yield b'data: ' + orjson.dumps({"error": f"An internal error occurred: {str(e)}"}) + b'\n\n'
+        yield b'data: {"done": true}\n\n'
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        # X-Accel-Buffering stops nginx-style proxies from buffering the stream
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/analytics/mtbf')
+def analytics_mtbf():
+    location = request.args.get('location')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if not (location and start_date and end_date):
+        return jsonify({"error": "location, start_date and end_date are required"}), 400
+
+    try:
+        results = calculate_mtbf(location, start_date, end_date)
+        return Response(orjson.dumps(sanitize_for_json(results)), mimetype='application/json')
+    except Exception as e:
+        print(f"Error during mtbf: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+@app.route('/analytics/dashboard')
+def analytics_dashboard():
+    location = request.args.get('location')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if not (location and start_date and end_date):
+        return jsonify({"error": "location, start_date and end_date are required"}), 400
+
+    try:
+        results = run_dashboard(location, start_date, end_date)
+        return Response(orjson.dumps(sanitize_for_json(results)), mimetype='application/json')
+    except Exception as e:
+        print(f"Error during dashboard: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
+
+@app.route('/analytics/costliest-faults')
+def analytics_costliest_faults():
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if not (start_date and end_date):
+        return jsonify({"error": "start_date and end_date are required"}), 400
+
+    try:
+        top_faults, loss_split = analyze_costliest_faults(start_date, end_date)
+        return Response(
+            orjson.dumps(sanitize_for_json({"top_faults": top_faults, "loss_split": loss_split})),
+            mimetype='application/json',
+        )
+    except Exception as e:
+        print(f"Error during costliest-faults: {e}")
+        return jsonify({"error": f"An internal error occurred: {str(e)}"}), 500
 
 @app.route('/ask', methods=['POST'])
 def ask():
-    if not connector:
+    # Reject oversized payloads before spending any JSON-parse CPU on them
+    if (request.content_length or 0) > 8192:
+        return jsonify({"error": "Payload too large"}), 413
+
+    try:
+        get_connector()
+    except Exception as e:
+        print(f"FATAL: Failed to initialize Neo4jLLMConnector. Check credentials. Error: {e}")
         return jsonify({"error": "Application not initialized. Check server logs."}), 500
-    
-    data = request.get_json()
+
+    # silent= avoids raising on malformed bodies, cache= skips stashing the
+    # parsed dict on the request object we are about to throw away
+    data = request.get_json(silent=True, cache=False) or {}
     question = data.get('question')
     if not question:
         return jsonify({"error": "No question provided"}), 400
 
     try:
-        cypher_query, final_answer = connector.ask(question)
+        cypher_query, final_answer = _ask_single_flight(question.strip())
         # Use the sanitizer before sending the response
         sanitized_answer = sanitize_for_json(final_answer)
-        return jsonify({"cypher_query": cypher_query, "final_answer": sanitized_answer})
+        # orjson serializes large tabular answers far faster than stdlib json
+        return Response(
+            orjson.dumps({"cypher_query": cypher_query, "final_answer": sanitized_answer}),
+            mimetype='application/json',
+        )
     except Exception as e:
         # Provide a more informative error message to the UI
         print(f"Error during ask: {e}")
@@ -0,0 +1,14 @@
+"""
+ASGI entrypoint, served with:
+
+    uvicorn asgi:app --workers 2 --loop uvloop --http httptools
+
+Wrapping the Flask app lets uvicorn's event loop hold many open /ask
+connections per worker while the blocking LLM + Neo4j calls run on the
+executor thread pool, instead of pinning throughput to workers * threads.
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+
+app = WsgiToAsgi(flask_app)
@@ -0,0 +1,13 @@
+import functools
+
+from dotenv import load_dotenv
+
+
+@functools.cache
+def load_env():
+    """
+    Parse .env into the process environment exactly once. Modules call this
+    instead of load_dotenv() directly, so repeated imports (and dev-server
+    reloads re-importing modules) don't re-open and re-parse the file.
+    """
+    load_dotenv()
@@ -1,23 +1,100 @@
+import asyncio
+import functools
+import hashlib
+import json
 import os
+import pathlib
+import re
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
 from langchain_community.graphs import Neo4jGraph
-from langchain.chains import GraphCypherQAChain
 from langchain_openai import ChatOpenAI
-from langchain.prompts.prompt import PromptTemplate
-from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, SystemMessage
+from config import load_env
 from db_connector import db_conn
 
-load_dotenv()
+load_env()
+
+# Cypher generation is a short, tightly constrained task: the mini model is
+# ~3x faster per token and more than sufficient for it. Override via env for
+# A/B comparisons.
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# One HTTP/2 connection pool shared by every connector instance keeps the
+# TLS session to OpenAI warm, so repeated asks skip the handshake.
+_openai_http_client = httpx.Client(
+    http2=True, limits=httpx.Limits(max_keepalive_connections=10)
+)
 
 # --- START: Self-Contained Schema Builder Logic ---
+# Warm restarts read the schema from this file instead of re-running the
+# DISTINCT label scans against Neo4j; the TTL bounds staleness.
+SCHEMA_CACHE_PATH = pathlib.Path(".schema_cache.json")
+SCHEMA_TTL_SECONDS = int(os.getenv("SCHEMA_TTL_SECONDS", "3600"))
+
+# All three enum probes in one statement: one Bolt round trip and one planner
+# pass instead of three. ORDER BY inside each branch keeps the collected
+# lists (and so the cached schema text) stable across rebuilds.
+DISTINCT_VALUES_QUERY = """
+CALL {
+    MATCH (n:MaintenanceWorkOrder) WHERE n.order_status IS NOT NULL
+    WITH DISTINCT n.order_status AS val ORDER BY val
+    RETURN 'order_status' AS k, collect(val) AS v
+    UNION
+    MATCH (n:MaintenanceWorkOrder) WHERE n.maintenance_type IS NOT NULL
+    WITH DISTINCT n.maintenance_type AS val ORDER BY val
+    RETURN 'maintenance_type' AS k, collect(val) AS v
+    UNION
+    MATCH (n:MachineFault) WHERE n.fault_category IS NOT NULL
+    WITH DISTINCT n.fault_category AS val ORDER BY val
+    RETURN 'fault_category' AS k, collect(val) AS v
+}
+RETURN k, v
+"""
+
+# Each probe branch reads a single property per label; with a range index
+# on that property the planner serves the DISTINCT from index pages
+# (NodeIndexScan) instead of scanning the node store, so probe cost tracks
+# the tiny enum cardinality rather than the label size. db_connector's
+# startup thread creates these too, but that runs in the background —
+# creating them synchronously here guarantees the probes are index-backed
+# even when the schema build wins that race.
+ENUM_INDEX_STATEMENTS = [
+    "CREATE RANGE INDEX wo_order_status IF NOT EXISTS FOR (wo:MaintenanceWorkOrder) ON (wo.order_status)",
+    "CREATE RANGE INDEX wo_maintenance_type IF NOT EXISTS FOR (wo:MaintenanceWorkOrder) ON (wo.maintenance_type)",
+    "CREATE RANGE INDEX fault_category IF NOT EXISTS FOR (f:MachineFault) ON (f.fault_category)",
+]
+
+
+def _ensure_enum_indexes():
+    try:
+        database_name = os.getenv("NEO4J_DATABASE", "neo4j")
+        with db_conn.driver.session(database=database_name) as session:
+            for statement in ENUM_INDEX_STATEMENTS:
+                session.run(statement).consume()
+    except Exception as e:
+        print(f"Enum index setup skipped: {e}")
+
+
+# Schemas change on the order of days, not requests: build once per process
+# and let every later call (new connector instances, reloads) hit the cache.
+@functools.cache
 def build_enriched_schema():
-    def get_distinct_values(node_label, property_name):
-        query = f"MATCH (n:{node_label}) WHERE n.{property_name} IS NOT NULL RETURN DISTINCT n.{property_name} AS values"
-        results = db_conn.run_query(query)
-        return [record["values"] for record in results]
+    try:
+        cached = json.loads(SCHEMA_CACHE_PATH.read_text())
+        if time.time() - cached["built_at"] < SCHEMA_TTL_SECONDS:
+            return cached["schema"]
+    except (OSError, ValueError, KeyError):
+        pass
 
-    order_status_values = get_distinct_values("MaintenanceWorkOrder", "order_status")
-    maintenance_type_values = get_distinct_values("MaintenanceWorkOrder", "maintenance_type")
-    fault_category_values = get_distinct_values("MachineFault", "fault_category")
+    _ensure_enum_indexes()
+    distinct_values = dict(db_conn.run_query_values(DISTINCT_VALUES_QUERY))
+    order_status_values = distinct_values.get("order_status", [])
+    maintenance_type_values = distinct_values.get("maintenance_type", [])
+    fault_category_values = distinct_values.get("fault_category", [])
 
     schema = f"""
 # Node Labels and Properties
@@ -37,10 +114,20 @@ def build_enriched_schema():
 (:MaintenanceWorkOrder)-[:PERFORMED_ON_EQUIPMENT]->(:Equipment)
 (:MachineDowntimeEvent)-[:PRECEDES]->(:MachineDowntimeEvent)
 """
+    try:
+        # Atomic write: a concurrent reader sees the old file or the new one
+        fd, tmp_path = tempfile.mkstemp(dir=".", suffix=".schema_cache")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"built_at": time.time(), "schema": schema}, f)
+        os.replace(tmp_path, SCHEMA_CACHE_PATH)
+    except OSError as e:
+        print(f"Could not persist schema cache: {e}")
     return schema
 # --- END: Self-Contained Schema Builder Logic ---
-
-graph_schema = build_enriched_schema()
+# No module-level build_enriched_schema() call: importing this module must
+# not touch Neo4j. The functools.cache on the builder means the first
+# caller (the connector's lazy graph/prompt setup) pays for the build once
+# and everyone after that gets the memoized string.
 
 # Curated examples to teach specific, complex patterns
 cypher_examples = [
@@ -66,9 +153,35 @@ cypher_examples = [
         "query": """MATCH (wo:MaintenanceWorkOrder)
                     WHERE wo.order_status IN ["In Progress", "Not Started", "Incomplete"] AND wo.planned_date < date()
                     RETURN wo.work_order_id, wo.work_order_description, wo.planned_date;""",
+    },
+    # Teaches the batched shape: correlate *every* work order with its
+    # follow-up downtime in one statement, instead of one query per order.
+    {
+        "question": "Did any machine record downtime within 7 days after its maintenance was completed?",
+        "query": """MATCH (wo:MaintenanceWorkOrder)-[:PERFORMED_ON_EQUIPMENT]->(:Equipment)-[:MAPS_TO]->(m:Machine)-[:RECORDED_DOWNTIME_EVENT]->(d:MachineDowntimeEvent)
+                    WHERE wo.actual_finish_date IS NOT NULL
+                    AND d.event_start_datetime > datetime(toString(wo.actual_finish_date))
+                    AND d.event_start_datetime < datetime(toString(wo.actual_finish_date)) + duration({days: 7})
+                    RETURN m.machine_description AS machine, wo.work_order_id AS work_order, d.event_start_datetime AS downtime_start;""",
     }
 ]
 
+def _render_examples(examples):
+    # The triple-quoted example queries carry ~20 spaces of indentation per
+    # line; strip it so we don't ship whitespace tokens to the LLM.
+    return "\n\n".join(
+        "Question: {question}\nQuery:\n{query}".format(
+            question=example["question"],
+            query="\n".join(line.strip() for line in example["query"].splitlines()),
+        )
+        for example in examples
+    )
+
+# Rendered once at import. Keeping the serialized form byte-identical across
+# calls (instead of re-stringifying the list per prompt) also lets OpenAI's
+# prompt prefix cache hit, since the static prefix never changes.
+EXAMPLES_STR = _render_examples(cypher_examples)
+
 # A new, more forceful and rule-driven prompt template
 CYPHER_GENERATION_TEMPLATE = """You are an expert Neo4j developer. Your ONLY task is to write a single, syntactically correct Cypher query to answer the user's question.
 
@@ -83,38 +196,490 @@ Schema:
 {schema}
 ---
 Examples:
-{examples}
----
-Question: {question}"""
+{examples}"""
+
+# Only the question travels in the human message. Keeping the schema, rules
+# and examples in the *system* message makes the whole static prefix
+# eligible for provider-side prompt caching, which keys on system-role
+# prefixes; the trailing "Cypher:" in the human message primes the
+# completion.
+def build_system_message(examples_str, schema):
+    # Plain str.replace instead of a template Formatter pass: the schema
+    # text contains literal braces, nothing else is dynamic, and a prebuilt
+    # SystemMessage object costs zero parsing per request.
+    text = CYPHER_GENERATION_TEMPLATE.replace("{examples}", examples_str)
+    return SystemMessage(content=text.replace("{schema}", schema))
+
+# Questions identical to a curated example (the UI surfaces them as
+# suggestions) need no LLM at all: normalized question -> ready Cypher.
+EXAMPLE_INDEX = {
+    example["question"].strip().lower(): "\n".join(
+        line.strip() for line in example["query"].splitlines()
+    ).rstrip(";")
+    for example in cypher_examples
+}
+
+# Words that scope a question beyond what a canned template answers — date
+# windows, statuses, ordinal windows. A template phrase appearing alongside
+# one of these ("total downtime for 'X' last month") is a different question
+# than the template's, so routing must fall through to the LLM, which honors
+# the qualifier. False positives here only cost an LLM call, never a wrong
+# answer.
+_TEMPLATE_QUALIFIER_RE = re.compile(
+    r"\b(?:last|past|previous|recent|this|since|before|after|between|during|"
+    r"today|yesterday|week|month|year|january|february|march|april|may|june|"
+    r"july|august|september|october|november|december|\d{4}|"
+    r"open|closed|complete|completed|pending|overdue|in progress|not started|"
+    r"incomplete)\b",
+    re.I,
+)
+
+# Tier-1 template matcher: question shapes we already know the Cypher for
+# skip the LLM entirely — one Neo4j round trip against a parameterized query,
+# so the server reuses one cached plan per template. The bare count templates
+# are anchored to the whole question (allowing only "are there" and trailing
+# punctuation): an unanchored search let "how many machines had downtime last
+# week?" return the total machine count.
+CYPHER_TEMPLATES = [
+    (
+        re.compile(r"total downtime.*for (?:the )?['\"](?P<machine>[^'\"]+)['\"]", re.I),
+        "MATCH (m:Machine {machine_description: $machine})-[:RECORDED_DOWNTIME_EVENT]->(d:MachineDowntimeEvent) "
+        "RETURN sum(d.downtime_in_minutes) AS total_downtime_minutes",
+    ),
+    (
+        re.compile(r"faults? (?:on|for) (?:the )?['\"](?P<machine>[^'\"]+)['\"]", re.I),
+        "MATCH (m:Machine {machine_description: $machine})-[:RECORDED_DOWNTIME_EVENT]->(:MachineDowntimeEvent)"
+        "-[:DUE_TO_FAULT]->(f:MachineFault) "
+        "RETURN f.fault_description AS fault, count(*) AS occurrences ORDER BY occurrences DESC",
+    ),
+    (
+        re.compile(r"^how many machines(?: are there)?[\s?.!]*$", re.I),
+        "MATCH (m:Machine) RETURN count(m) AS total_machines",
+    ),
+    # "open" must route to its own filtered count — the unfiltered template
+    # below would confidently return the total across all statuses. The
+    # status list mirrors the open-work-orders curated example above.
+    (
+        re.compile(
+            r"^how many (?:open work orders(?: are there)?|work orders are open)[\s?.!]*$",
+            re.I,
+        ),
+        "MATCH (wo:MaintenanceWorkOrder) "
+        "WHERE wo.order_status IN ['In Progress', 'Not Started', 'Incomplete'] "
+        "RETURN count(wo) AS open_work_orders",
+    ),
+    (
+        re.compile(r"^how many work orders(?: are there)?[\s?.!]*$", re.I),
+        "MATCH (wo:MaintenanceWorkOrder) RETURN count(wo) AS total_work_orders",
+    ),
+]
+
+
+# Cheap keyword router: questions that clearly belong to one domain get a
+# prompt carrying only the relevant sub-schema and examples, cutting prompt
+# tokens (and so time-to-first-token) for the common simple questions.
+# Anything unmatched — or matching more than one class — falls back to the
+# full prompt.
+QUESTION_CLASSES = [
+    {
+        "name": "downtime",
+        "pattern": re.compile(r"downtime|mtbf|failure|fault|breakdown|cascad|root cause", re.I),
+        "labels": ["Machine", "MachineDowntimeEvent", "MachineFault", "Location"],
+        "examples": [cypher_examples[0], cypher_examples[1]],
+    },
+    {
+        "name": "work_order",
+        "pattern": re.compile(r"work order|maintenance|planned|overdue|order status", re.I),
+        "labels": ["MaintenanceWorkOrder", "Equipment", "Machine", "MachineDowntimeEvent"],
+        "examples": [cypher_examples[2], cypher_examples[3]],
+    },
+]
+
+
+def _subset_schema(schema, labels):
+    """Keep only the schema lines that mention at least one of the labels."""
+    kept = []
+    for line in schema.splitlines():
+        if line.startswith("(:") and not any(f":{label}" in line for label in labels):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def _strip_enum_comments(schema):
+    """Drop the `/* one of: [...] */` enum hints from a schema string."""
+    return re.sub(r" /\* one of: .*? \*/", "", schema)
+
+
+def build_class_message(spec, lean=False):
+    schema = _subset_schema(build_enriched_schema(), spec["labels"])
+    if lean:
+        schema = _strip_enum_comments(schema)
+    return build_system_message(_render_examples(spec["examples"]), schema)
+
+
+# Sentinel answer for swallowed pipeline failures. Callers (the app's
+# response caches) compare against this to avoid memoizing transient
+# errors as if they were real answers.
+ERROR_MESSAGE = "An error occurred while processing the query."
+
+# Result rows are memoized per generated statement for this long. The data
+# is operational and minutes-level staleness is acceptable; the TTL matches
+# the semantic answer cache so the two layers age together.
+RESULT_CACHE_TTL_SECONDS = 300
+RESULT_CACHE_MAX_ENTRIES = 1024
+
+# Unbounded generated queries get this LIMIT appended so a pathological
+# generation can't stream an entire label through the app's memory.
+MAX_RESULT_ROWS = 1000
+
+# A statement counts as row-bounded if it carries its own LIMIT or returns
+# aggregates (which collapse to a handful of rows anyway).
+_BOUNDED_RE = re.compile(
+    r"\bLIMIT\s+(\d+|\$\w+)|\b(count|sum|avg|min|max|collect)\s*\(", re.I
+)
+
+# Plan operators that mean the planner gave up on indexes: the query would
+# touch every node (or the cross product of two sets). Catching these with a
+# millisecond EXPLAIN round trip is far cheaper than letting the scan run.
+UNSAFE_PLAN_OPERATORS = ("AllNodesScan", "CartesianProduct")
+
+
+def _strip_fences(text):
+    """Drop a leading/trailing markdown code fence and any trailing
+    statement terminator from an LLM completion. The `;` matters: _execute
+    may append a LIMIT clause, and `...;\\nLIMIT 1000` is invalid Cypher —
+    the few-shot examples all end with `;`, so generations routinely do too."""
+    text = text.strip()
+    text = text.removeprefix("```cypher").removeprefix("```").strip()
+    return text.removesuffix("```").strip().rstrip(";").rstrip()
+
+
+def _plan_operators(plan):
+    """Flatten an EXPLAIN plan tree into its operator names."""
+    operators = [plan.get("operatorType", "")]
+    for child in plan.get("children", []):
+        operators.extend(_plan_operators(child))
+    return operators
+
+
+# Quoted strings (backslash or doubled-quote escapes), or bare numbers that
+# are not part of an identifier, a property access or a relationship-pattern
+# bound — [:PRECEDES*2] as much as [:PRECEDES*1..3], since bounds cannot be
+# parameters in Cypher.
+_LITERAL_RE = re.compile(
+    r"'(?:[^'\\]|\\.|'')*'"
+    r'|"(?:[^"\\]|\\.|"")*"'
+    r"|(?<![\w$.\-*])\d+(?:\.\d+)?(?![\w.])"
+)
+
+
+def parameterize_literals(cypher):
+    """
+    Lift inline literals out of a generated statement into $ parameters.
+    Two questions that differ only in values ("faults on 'Press 1'" vs
+    "'Press 2'") then share one statement shape, so Neo4j's server-side
+    plan cache is hit instead of replanning per value.
+    """
+    params = {}
+
+    def _lift(match):
+        token = match.group(0)
+        if token[0] in "'\"":
+            quote = token[0]
+            # Undo both Cypher escape forms: \' and '' (resp. \" and "")
+            value = token[1:-1].replace("\\" + quote, quote).replace(quote * 2, quote)
+        else:
+            value = float(token) if "." in token else int(token)
+        name = f"p{len(params)}"
+        params[name] = value
+        return f"${name}"
+
+    return _LITERAL_RE.sub(_lift, cypher), params
+
+
+# Process-wide singletons: no matter how many connector instances exist,
+# there is one Bolt driver (one handshake, one connection pool) and one
+# OpenAI client per process. functools.cache makes re-instantiating
+# Neo4jLLMConnector free of any redial or TLS cost.
+@functools.cache
+def _shared_graph():
+    # Neo4jGraph owns its driver (it does not accept an external one), so
+    # mirror db_connector's pool settings: one long-lived driver per stack,
+    # sessions borrow pooled connections, nothing redials per query.
+    graph = Neo4jGraph(
+        url=os.getenv("NEO4J_URI"),
+        username=os.getenv("NEO4J_USER"),
+        password=os.getenv("NEO4J_PASSWORD"),
+        database=os.getenv("NEO4J_DATABASE", "neo4j"),
+        # Neo4jGraph runs an apoc.meta introspection during __init__ by
+        # default — a multi-second scan on big graphs that we would throw
+        # away anyway, since the enriched schema is assigned right below.
+        refresh_schema=False,
+        driver_config={
+            "max_connection_pool_size": 50,
+            "connection_acquisition_timeout": 30,
+            "max_connection_lifetime": 3600,
+            "keep_alive": True,
+            # Most generated queries return a handful of aggregate rows;
+            # a small fetch_size avoids extra PULL round trips.
+            "fetch_size": 100,
+            "user_agent": "neo4j-chat-app/1.0",
+        },
+    )
+    # Range-index setup (SCHEMA_INDEX_STATEMENTS) happens in db_connector's
+    # startup thread, so by the time this lazy graph exists the indexes do too.
+    graph.schema = build_enriched_schema()
+    return graph
+
+
+@functools.cache
+def _shared_llm():
+    # max_tokens caps runaway generations; a single Cypher query fits
+    # comfortably in 256 tokens. streaming=True lets tokens flow as they
+    # are generated instead of waiting for the full completion.
+    # The stop sequences end generation right after the first Cypher
+    # statement, so the model can't append explanations, extra queries
+    # or a fenced block that would break downstream parsing.
+    # seed pinning (with temperature=0) makes completions reproducible, so
+    # every cache keyed on the question or the generated Cypher stays hot
+    # across restarts instead of churning on sampling noise.
+    return ChatOpenAI(
+        temperature=0,
+        model=OPENAI_MODEL,
+        streaming=True,
+        max_tokens=256,
+        seed=0,
+        stop=[";\n\n", "\n```", "\n---", "\nQuestion:"],
+        http_client=_openai_http_client,
+    )
 
-CYPHER_PROMPT = PromptTemplate.from_template(CYPHER_GENERATION_TEMPLATE)
 
 class Neo4jLLMConnector:
-    def __init__(self):
-        self.graph = Neo4jGraph(
-            url=os.getenv("NEO4J_URI"),
-            username=os.getenv("NEO4J_USER"),
-            password=os.getenv("NEO4J_PASSWORD"),
-            database=os.getenv("NEO4J_DATABASE", "neo4j")
-        )
-        self.graph.schema = graph_schema
-        self.llm = ChatOpenAI(temperature=0, model="gpt-4o")
-        
-        self.chain = GraphCypherQAChain.from_llm(
-            graph=self.graph,
-            llm=self.llm,
-            cypher_prompt=CYPHER_PROMPT,
-            verbose=True,
-            return_intermediate_steps=True,
-            allow_dangerous_requests=True,
-            return_direct=True
-        )
+    # Every heavy member is a cached property: constructing the connector is
+    # free, and the Bolt connection, OpenAI client and prompts materialize on
+    # the first ask instead of blocking startup.
 
-    def ask(self, question):
+    @functools.cached_property
+    def graph(self):
+        return _shared_graph()
+
+    @functools.cached_property
+    def llm(self):
+        return _shared_llm()
+
+    @functools.cached_property
+    def _system_messages(self):
+        # {lean?: {class name (None = full fallback): SystemMessage}}. The
+        # lean variants drop the enum-value comments — on a semantic-cache
+        # near miss the model is adapting a pattern it already produced, so
+        # the hints only cost prompt tokens.
+        variants = {}
+        for lean in (False, True):
+            schema = build_enriched_schema()
+            if lean:
+                schema = _strip_enum_comments(schema)
+            messages = {None: build_system_message(EXAMPLES_STR, schema)}
+            for spec in QUESTION_CLASSES:
+                messages[spec["name"]] = build_class_message(spec, lean=lean)
+            variants[lean] = messages
+        return variants
+
+    @functools.cached_property
+    def _plan_cache(self):
+        # cypher text -> bool; plan shapes are deterministic for a given
+        # statement, so repeated questions skip the EXPLAIN round trip too.
+        return {}
+
+    @functools.cached_property
+    def _result_cache(self):
+        # cypher digest -> (stored_at, rows). Keyed on the generated Cypher
+        # (values included), so differently phrased questions that compile to
+        # the same statement share one Neo4j execution.
+        return {}
+
+    def _try_template(self, question):
+        """Answer from a curated example or a pre-written parameterized
+        query, or None if nothing matches."""
+        example_cypher = EXAMPLE_INDEX.get(question.strip().lower())
+        if example_cypher is not None:
+            return example_cypher, self._execute(example_cypher)
+        for pattern, cypher in CYPHER_TEMPLATES:
+            match = pattern.search(question.strip())
+            if match is None:
+                continue
+            # The machine-scoped templates match anywhere in the question,
+            # so a qualifier next to the phrase means the canned query would
+            # answer the wrong question — hand those to the LLM. The count
+            # templates are anchored, so they can't co-occur with one.
+            if match.groupdict() and _TEMPLATE_QUALIFIER_RE.search(question):
+                break
+            return cypher, self.graph.query(cypher, params=match.groupdict())
+        return None
+
+    def _prompt_key(self, question):
+        # A question matching several classes spans domains ("downtime
+        # within a week after maintenance"): any single sub-schema would
+        # hide labels and examples the other half needs, and rule 5 forbids
+        # the model from reaching outside the schema it was given. Only an
+        # unambiguous single match gets the trimmed prompt.
+        matched = [
+            spec["name"] for spec in QUESTION_CLASSES if spec["pattern"].search(question)
+        ]
+        return matched[0] if len(matched) == 1 else None
+
+    def _messages(self, question, lean=False):
+        # The system message is prebuilt; only this f-string runs per request.
+        system = self._system_messages[lean][self._prompt_key(question)]
+        return [system, HumanMessage(content=f"Question: {question}\nCypher:")]
+
+    def _generate_cypher(self, question, lean=False):
+        # One LLM call, one graph call: the old GraphCypherQAChain wrapper
+        # added a second LLM pass to rephrase results; returning rows directly
+        # halves the OpenAI round trips and keeps the Cypher in our hands for
+        # the plan check below.
+        response = self.llm.invoke(self._messages(question, lean=lean))
+        return _strip_fences(response.content)
+
+    def _plan_is_safe(self, cypher):
+        """EXPLAIN the statement (costs no execution) and refuse plans that
+        would scan the whole graph. Verdicts are cached per statement."""
+        cached = self._plan_cache.get(cypher)
+        if cached is not None:
+            return cached
         try:
-            result = self.chain.invoke({"query": question, "examples": str(cypher_examples)})
-            cypher_query = result.get("intermediate_steps", [{}])[0].get("query", "Query not generated.")
-            final_answer = result.get("result", "An error occurred or no data was found.")
-            return cypher_query, final_answer
+            database_name = os.getenv("NEO4J_DATABASE", "neo4j")
+            with db_conn.driver.session(database=database_name) as session:
+                summary = session.run("EXPLAIN " + cypher).consume()
+            operators = _plan_operators(summary.plan or {})
+            safe = not any(op in UNSAFE_PLAN_OPERATORS for op in operators)
         except Exception as e:
-            return "An error occurred while processing the query.", str(e)
+            # A failed plan check should never block a query that would have
+            # worked; fall through to execution.
+            print(f"Plan check skipped: {e}")
+            safe = True
+        self._plan_cache[cypher] = safe
+        return safe
+
+    def _execute(self, cypher):
+        key = hashlib.blake2b(cypher.encode("utf-8"), digest_size=16).digest()
+        now = time.monotonic()
+        hit = self._result_cache.get(key)
+        if hit is not None and now - hit[0] < RESULT_CACHE_TTL_SECONDS:
+            return hit[1]
+        # The plan check and cache both run on the parameterized shape, so
+        # value-only variations of a statement share one verdict and one
+        # server-side plan.
+        statement, params = parameterize_literals(cypher)
+        if not _BOUNDED_RE.search(statement):
+            statement += f"\nLIMIT {MAX_RESULT_ROWS}"
+        if not self._plan_is_safe(statement):
+            return (
+                "The generated query was rejected because its plan would scan "
+                "the entire graph. Please ask a more specific question."
+            )
+        rows = self.graph.query(statement, params=params)
+        if len(self._result_cache) >= RESULT_CACHE_MAX_ENTRIES:
+            self._prune_result_cache(now)
+        self._result_cache[key] = (now, rows)
+        return rows
+
+    def _prune_result_cache(self, now):
+        for key, (stored_at, _) in list(self._result_cache.items()):
+            if now - stored_at >= RESULT_CACHE_TTL_SECONDS:
+                del self._result_cache[key]
+        if len(self._result_cache) >= RESULT_CACHE_MAX_ENTRIES:
+            self._result_cache.clear()
+
+    def refresh(self):
+        """Drop memoized query results, e.g. after a bulk data load."""
+        self._result_cache.clear()
+
+    def ask(self, question, lean=False):
+        try:
+            templated = self._try_template(question)
+            if templated is not None:
+                return templated
+            cypher = self._generate_cypher(question, lean=lean)
+            return cypher, self._execute(cypher)
+        except Exception as e:
+            return ERROR_MESSAGE, str(e)
+
+    def stream_ask(self, question, lean=False):
+        """
+        Generator variant of ask() for streaming UIs: yields the Cypher
+        token-by-token as the model emits it ({"cypher_token": ...}), then
+        one final {"cypher_query", "final_answer"} event once the statement
+        has executed. Template and example hits skip straight to the final
+        event. Exceptions propagate so the caller can emit its own error.
+        """
+        templated = self._try_template(question)
+        if templated is not None:
+            cypher, answer = templated
+            yield {"cypher_query": cypher, "final_answer": answer}
+            return
+        parts = []
+        for chunk in self.llm.stream(self._messages(question, lean=lean)):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield {"cypher_token": chunk.content}
+        cypher = _strip_fences("".join(parts))
+        yield {"cypher_query": cypher, "final_answer": self._execute(cypher)}
+
+    async def aask(self, question, lean=False):
+        """
+        ask() for async callers (the ASGI wrapper, notebooks): the whole
+        pipeline runs on a worker thread so the event loop stays free during
+        the LLM and Bolt waits. The Neo4j driver in use is synchronous, so
+        to_thread is the honest seam rather than a partially-async pipeline.
+        """
+        return await asyncio.to_thread(self.ask, question, lean)
+
+    async def aask_batch(self, requests):
+        """Async counterpart of ask_batch; see aask() for the thread seam."""
+        return await asyncio.to_thread(self.ask_batch, requests)
+
+    def ask_batch(self, requests):
+        """
+        Answer several (question, lean) requests with one batched LLM call
+        instead of sequential invokes, so concurrent callers share the round
+        trip. Requests are grouped by routed prompt class and variant first.
+        Failures are contained per request (or per prompt group when the
+        shared LLM call itself fails) — one bad statement never replaces the
+        whole batch's answers with the error tuple.
+        """
+        answers = [None] * len(requests)
+        groups = defaultdict(list)
+        for index, (question, lean) in enumerate(requests):
+            try:
+                templated = self._try_template(question)
+            except Exception as e:
+                answers[index] = (ERROR_MESSAGE, str(e))
+                continue
+            if templated is not None:
+                answers[index] = templated
+            else:
+                groups[(self._prompt_key(question), lean)].append(index)
+        for (key, lean), indexes in groups.items():
+            try:
+                system = self._system_messages[lean][key]
+                # max_concurrency bounds the parallel OpenAI calls per batch
+                # so a burst can't exhaust the shared HTTP/2 pool.
+                responses = self.llm.batch(
+                    [
+                        [system, HumanMessage(content=f"Question: {requests[i][0]}\nCypher:")]
+                        for i in indexes
+                    ],
+                    config={"max_concurrency": 8},
+                )
+            except Exception as e:
+                for i in indexes:
+                    answers[i] = (ERROR_MESSAGE, str(e))
+                continue
+            for i, response in zip(indexes, responses):
+                try:
+                    cypher = _strip_fences(response.content)
+                    answers[i] = (cypher, self._execute(cypher))
+                except Exception as e:
+                    answers[i] = (ERROR_MESSAGE, str(e))
+        return answers
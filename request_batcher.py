@@ -0,0 +1,55 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Collect up to K_MAX questions that arrive within the batch window and
+# answer them with a single batched connector call.
+BATCH_WINDOW_MS = 8
+K_MAX = 16
+
+
+class RequestBatcher:
+    """
+    Coalesces concurrent questions into one batched connector call.
+
+    Each caller submits a question and blocks on a Future. A background
+    worker drains the queue: it takes the first pending question, waits up
+    to the batch window for more to arrive (capped at k_max), then resolves
+    the whole batch with one call to `ask_batch`. Under concurrent traffic
+    this fuses N independent LLM round trips into one.
+    """
+
+    def __init__(self, ask_batch, k_max=K_MAX, batch_window_ms=BATCH_WINDOW_MS):
+        self._ask_batch = ask_batch
+        self._k_max = k_max
+        self._window = batch_window_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, question, lean=False):
+        """Enqueue a question and block until its batch is answered."""
+        future = Future()
+        self._queue.put(((question, lean), future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._window
+            while len(batch) < self._k_max:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                results = self._ask_batch([request for request, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import redis
+from config import load_env
+from redis.commands.search.field import TextField, VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+from sentence_transformers import SentenceTransformer
+
+load_env()
+
+# Cache entries expire after 5 minutes; a hit must be at least this similar.
+CACHE_TTL_SECONDS = 300
+SIMILARITY_THRESHOLD = 0.9
+# Below the hit threshold but above this, the question is a paraphrase of
+# something already answered: callers can use a leaner prompt for it.
+NEAR_MISS_THRESHOLD = 0.85
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+INDEX_NAME = "ask_cache_idx"
+KEY_PREFIX = "ask_cache:"
+
+
+class SemanticCache:
+    """
+    Redis-backed semantic cache for (cypher_query, final_answer) responses.
+
+    Questions are embedded with a small sentence-transformer model and stored
+    in a RediSearch HNSW index. A lookup runs a KNN-1 vector search over prior
+    questions; if the nearest neighbour's cosine similarity is >= 0.9 the
+    cached response is returned without touching the LLM or Neo4j.
+    """
+
+    def __init__(self):
+        # Rough (unlocked) counters for tuning the thresholds above.
+        self.stats = {"hit": 0, "near_miss": 0, "miss": 0}
+        try:
+            # decode_responses must stay False so embeddings round-trip as raw bytes
+            self.redis = redis.Redis.from_url(
+                os.getenv("REDIS_URL", "redis://localhost:6379"),
+                decode_responses=False,
+            )
+            self.redis.ping()
+        except Exception as e:
+            print(f"Semantic cache disabled, could not reach Redis: {e}")
+            self.redis = None
+            return
+        self.model = SentenceTransformer(EMBEDDING_MODEL)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self._ensure_index()
+
+    def _ensure_index(self):
+        try:
+            self.redis.ft(INDEX_NAME).create_index(
+                fields=[
+                    TextField("question"),
+                    VectorField(
+                        "embedding",
+                        "HNSW",
+                        {"TYPE": "FLOAT32", "DIM": self.dim, "DISTANCE_METRIC": "COSINE"},
+                    ),
+                ],
+                definition=IndexDefinition(prefix=[KEY_PREFIX], index_type=IndexType.HASH),
+            )
+        except redis.ResponseError:
+            # Index already exists from a previous worker / deploy
+            pass
+
+    def _embed(self, question):
+        return self.model.encode(question).astype(np.float32)
+
+    def get(self, question):
+        """
+        Return (cached (cypher_query, final_answer) tuple or None, near_miss).
+
+        near_miss is True when the nearest neighbour fell short of the hit
+        threshold but was at least NEAR_MISS_THRESHOLD similar — the answer
+        can't be reused, but the question is close enough to known territory
+        that the caller may generate with a leaner prompt.
+        """
+        if not self.redis:
+            return None, False
+        try:
+            query = (
+                Query("*=>[KNN 1 @embedding $vec AS score]")
+                .sort_by("score")
+                .return_fields("response", "score")
+                .dialect(2)
+            )
+            results = self.redis.ft(INDEX_NAME).search(
+                query, query_params={"vec": self._embed(question).tobytes()}
+            )
+            if not results.docs:
+                self.stats["miss"] += 1
+                return None, False
+            doc = results.docs[0]
+            # RediSearch reports cosine *distance*: 0.1 distance == 0.9 similarity
+            distance = float(doc.score)
+            if distance > 1.0 - SIMILARITY_THRESHOLD:
+                near_miss = distance <= 1.0 - NEAR_MISS_THRESHOLD
+                self.stats["near_miss" if near_miss else "miss"] += 1
+                return None, near_miss
+            self.stats["hit"] += 1
+            cypher_query, final_answer = json.loads(doc.response)
+            return (cypher_query, final_answer), False
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+            return None, False
+
+    def set(self, question, cypher_query, final_answer):
+        if not self.redis:
+            return
+        try:
+            key = KEY_PREFIX + hashlib.sha256(question.encode("utf-8")).hexdigest()
+            self.redis.hset(
+                key,
+                mapping={
+                    "question": question,
+                    "embedding": self._embed(question).tobytes(),
+                    "response": json.dumps([cypher_query, final_answer], default=str),
+                },
+            )
+            self.redis.expire(key, CACHE_TTL_SECONDS)
+        except Exception as e:
+            print(f"Semantic cache store failed: {e}")
+
+
+semantic_cache = SemanticCache()